@@ -0,0 +1,278 @@
+"""
+Búsqueda de clientes por apodo, uid, ID de base de datos o clid
+
+Mantiene índices en memoria con expulsión LRU y caducidad (TTL). Los fallos
+se resuelven consultando el servidor (clientinfo, clientgetids o páginas de
+clientdblist) y los eventos de entrada/salida mantienen los índices al día.
+Las búsquedas sin resultado se recuerdan un rato para no repetir el recorrido
+de clientdblist con cada apodo mal escrito.
+"""
+
+import time
+from collections import OrderedDict
+from serverquery import escape, parse_response
+from config import (
+    LOOKUP_MAX_ENTRIES, LOOKUP_TTL, LOOKUP_PAGE_SIZE, LOOKUP_MAX_PAGES, LOOKUP_MISS_TTL
+)
+
+
+class ClientLookup:
+    """Índices de clientes con caché LRU+TTL"""
+
+    def __init__(self, bot, max_entries=LOOKUP_MAX_ENTRIES, ttl=LOOKUP_TTL,
+                 page_size=LOOKUP_PAGE_SIZE, max_pages=LOOKUP_MAX_PAGES, miss_ttl=LOOKUP_MISS_TTL):
+        self.bot = bot
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.miss_ttl = miss_ttl
+
+        # Entradas por cldbid, en orden de uso (la más reciente al final)
+        self.entries = OrderedDict()
+        self.by_uid = {}
+        self.by_nickname = {}
+        self.by_clid = {}
+
+        # Búsquedas recientes sin resultado: clave -> momento del fallo
+        self.missed = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.pages = 0
+        self.evictions = 0
+
+    # Consultas
+
+    def find_by_clid(self, clid):
+        """Buscar un cliente conectado por su clid"""
+        clid = str(clid)
+        entry = self._count(self._cached(self.by_clid, clid))
+        if entry is None:
+            entry = self._fetch_clid(clid)
+        return entry
+
+    def resolve(self, value):
+        """Buscar un cliente por cualquiera de sus identificadores
+
+        Un número se prueba como clid y luego como cldbid; cualquier otro
+        texto como uid o como apodo. Los fallos se resuelven con una sola
+        consulta al servidor y, si no aparece, no se vuelve a buscar hasta
+        pasados `miss_ttl` segundos.
+        """
+        value = value.strip()
+        key = value.lower()
+
+        if value.isdigit():
+            entry = self._cached(self.by_clid, value) or self._cached(self.entries, value, is_primary=True)
+        else:
+            entry = self._cached(self.by_uid, value) or self._cached(self.by_nickname, key)
+
+        if self._count(entry) is not None:
+            return entry
+
+        missed_at = self.missed.get(key)
+        if missed_at is not None and time.monotonic() - missed_at <= self.miss_ttl:
+            return None
+
+        if value.isdigit():
+            entry = self._fetch_clid(value) or self._scan_db(lambda record: record.get('cldbid') == value)
+        else:
+            entry = self._scan_db(
+                lambda record: (record.get('client_unique_identifier') == value or
+                                record.get('client_nickname', '').lower() == key)
+            )
+
+        if entry is None:
+            self._remember_miss(key)
+        return entry
+
+    def online_clid(self, entry):
+        """clid actual de un cliente conectado (None si no lo está)"""
+        if entry.get('clid'):
+            return entry['clid']
+        if not entry.get('uid'):
+            return None
+
+        self.fetches += 1
+        response = self.bot.send_command(f"clientgetids cluid={escape(entry['uid'])}")
+        if response and "error id=0" in response:
+            records = parse_response(response)
+            if records and records[0].get('clid'):
+                entry['clid'] = records[0]['clid']
+                self.by_clid[entry['clid']] = entry['cldbid']
+                return entry['clid']
+        return None
+
+    # Actualización
+
+    def observe(self, record):
+        """Guardar o actualizar un cliente a partir de un registro del servidor
+
+        Acepta registros de clientlist -uid, clientdblist, clientinfo y
+        notifycliententerview.
+        """
+        cldbid = record.get('client_database_id') or record.get('cldbid')
+        if not cldbid:
+            return None
+
+        entry = self.entries.get(cldbid)
+        if entry is None:
+            entry = {'cldbid': cldbid, 'uid': None, 'nickname': None, 'clid': None}
+            self.entries[cldbid] = entry
+        else:
+            self.entries.move_to_end(cldbid)
+            self._unindex(entry)
+
+        entry['uid'] = record.get('client_unique_identifier') or entry['uid']
+        entry['nickname'] = record.get('client_nickname') or entry['nickname']
+        entry['clid'] = record.get('clid') or entry['clid']
+        entry['fetched_at'] = time.monotonic()
+        self._index(entry)
+
+        while len(self.entries) > self.max_entries:
+            _, oldest = self.entries.popitem(last=False)
+            self._unindex(oldest)
+            self.evictions += 1
+
+        return entry
+
+    def on_client_enter(self, record):
+        """Evento notifycliententerview"""
+        self.observe(record)
+
+    def on_client_left(self, record):
+        """Evento notifyclientleftview - el clid deja de ser válido"""
+        cldbid = self.by_clid.pop(record.get('clid'), None)
+        entry = self.entries.get(cldbid)
+        if entry:
+            entry['clid'] = None
+
+    def clear(self):
+        """Vaciar la caché (por ejemplo al reconectar)"""
+        self.entries.clear()
+        self.by_uid.clear()
+        self.by_nickname.clear()
+        self.by_clid.clear()
+        self.missed.clear()
+
+    def stats(self):
+        """Estadísticas de uso de la caché"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'fetches': self.fetches,
+            'pages': self.pages,
+            'evictions': self.evictions,
+        }
+
+    # Internos
+
+    def _cached(self, index, key, is_primary=False):
+        """Entrada en caché para la clave, descartándola si caducó"""
+        cldbid = key if is_primary else index.get(key)
+        entry = self.entries.get(cldbid) if cldbid is not None else None
+        if entry is None:
+            return None
+
+        if time.monotonic() - entry['fetched_at'] > self.ttl:
+            # Caducada: descartarla y volver a consultar
+            del self.entries[cldbid]
+            self._unindex(entry)
+            return None
+
+        self.entries.move_to_end(cldbid)
+        return entry
+
+    def _count(self, entry):
+        """Contar un acierto o un fallo de caché"""
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _fetch_clid(self, clid):
+        """Consultar clientinfo para un clid que no está en caché"""
+        self.fetches += 1
+        response = self.bot.send_command(f"clientinfo clid={clid}")
+        if not response or "error id=0" not in response:
+            return None
+
+        records = parse_response(response)
+        if not records:
+            return None
+
+        record = records[0]
+        record['clid'] = clid
+        return self.observe(record)
+
+    def _scan_db(self, matches):
+        """Recorrer clientdblist por páginas hasta encontrar el cliente
+
+        Todos los registros leídos se guardan en caché, así que las
+        búsquedas siguientes de esos clientes no vuelven a consultar.
+        """
+        for page in range(self.max_pages):
+            self.fetches += 1
+            self.pages += 1
+            response = self.bot.send_command(
+                f"clientdblist start={page * self.page_size} duration={self.page_size}"
+            )
+            if not response or "error id=0" not in response:
+                # Fin de la lista (error 1281 "database empty result set") o fallo
+                return None
+
+            records = parse_response(response)
+            found = None
+            for record in records:
+                entry = self.observe(record)
+                if found is None and matches(record):
+                    found = entry
+
+            if found is not None:
+                # Volver a marcarla como la más reciente tras el resto de la página
+                if found['cldbid'] in self.entries:
+                    self.entries.move_to_end(found['cldbid'])
+                return found
+
+            if len(records) < self.page_size:
+                return None
+
+        self.bot.logger.warning(
+            f"⚠️ Búsqueda en clientdblist detenida tras {self.max_pages} páginas "
+            f"({self.max_pages * self.page_size} registros) sin llegar al final"
+        )
+        return None
+
+    def _remember_miss(self, key):
+        """Recordar una búsqueda sin resultado, descartando las caducadas"""
+        now = time.monotonic()
+        if len(self.missed) >= self.max_entries:
+            self.missed = {k: t for k, t in self.missed.items() if now - t <= self.miss_ttl}
+        self.missed[key] = now
+
+    def _index(self, entry):
+        cldbid = entry['cldbid']
+        # Un cliente recién visto deja de contar como búsqueda fallida
+        for key in (cldbid, entry['clid'], entry['uid'], entry['nickname']):
+            if key:
+                self.missed.pop(key.lower(), None)
+        if entry['uid']:
+            self.by_uid[entry['uid']] = cldbid
+        if entry['nickname']:
+            self.by_nickname[entry['nickname'].lower()] = cldbid
+        if entry['clid']:
+            self.by_clid[entry['clid']] = cldbid
+
+    def _unindex(self, entry):
+        cldbid = entry['cldbid']
+        for index, key in ((self.by_uid, entry['uid']),
+                           (self.by_nickname, (entry['nickname'] or '').lower()),
+                           (self.by_clid, entry['clid'])):
+            if key and index.get(key) == cldbid:
+                del index[key]
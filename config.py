@@ -15,3 +15,38 @@ MAX_RECONNECT_ATTEMPTS = 10
 
 # Configuración de logging
 LOG_LEVEL = "INFO"
+
+# Configuración de envíos masivos (mensajes y pokes)
+# Los valores por defecto respetan la protección anti-flood del servidor
+# (por defecto unos 50 comandos cada 3 segundos por IP)
+FANOUT_WINDOW = 5  # comandos en vuelo a la vez
+FANOUT_RATE = 10  # comandos por segundo
+FANOUT_REPLY_TIMEOUT = 5  # segundos
+FANOUT_FLOOD_RETRIES = 3  # reintentos por objetivo tras un "error id=524"
+
+# Activar solo si la IP del bot está en query_ip_allowlist.txt, donde el
+# servidor no aplica la protección anti-flood
+FANOUT_ALLOWLISTED = False
+FANOUT_ALLOWLISTED_WINDOW = 20  # comandos en vuelo a la vez
+FANOUT_ALLOWLISTED_RATE = 200  # comandos por segundo
+
+# Configuración de tareas periódicas
+KEEPALIVE_INTERVAL = 60  # segundos entre verificaciones de conexión
+STATUS_INTERVAL = 300  # segundos entre mensajes de estado
+SCHEDULER_JITTER = 5  # desplazamiento aleatorio máximo del primer arranque (segundos)
+SCHEDULER_LATE_THRESHOLD = 1.0  # retraso a partir del cual se avisa (segundos)
+
+# Configuración de la caché de búsqueda de clientes
+LOOKUP_MAX_ENTRIES = 5000  # clientes en memoria
+LOOKUP_TTL = 600  # segundos antes de volver a consultar
+LOOKUP_PAGE_SIZE = 200  # registros por página de clientdblist
+LOOKUP_MAX_PAGES = 50  # páginas como máximo por búsqueda
+LOOKUP_MISS_TTL = 60  # segundos que se recuerda una búsqueda sin resultado
+
+# Administradores del bot (identificadores únicos de cliente)
+ADMIN_UIDS = []
+
+# Configuración del perfilado bajo demanda (!prof o señal SIGUSR1)
+PROFILE_DIR = "profiles"  # carpeta donde se guardan los resultados
+PROFILE_TOP_N = 25  # entradas en cada resumen
+PROFILE_TRACE_FRAMES = 10  # marcos de pila guardados por tracemalloc
@@ -0,0 +1,260 @@
+"""
+Envío masivo de mensajes y pokes para el bot de TeamSpeak 3
+
+Los comandos se escriben en el socket de forma encadenada (varios en vuelo a
+la vez) y con límite de velocidad, en lugar de esperar la respuesta de cada
+uno antes de mandar el siguiente.
+"""
+
+import re
+import string
+import time
+from collections import deque
+from serverquery import escape, parse_error_line, parse_record
+from config import (
+    FANOUT_WINDOW, FANOUT_RATE, FANOUT_REPLY_TIMEOUT, FANOUT_FLOOD_RETRIES,
+    FANOUT_ALLOWLISTED, FANOUT_ALLOWLISTED_WINDOW, FANOUT_ALLOWLISTED_RATE
+)
+
+# Modos de destino de sendtextmessage
+TARGET_CLIENT = 1
+TARGET_CHANNEL = 2
+TARGET_SERVER = 3
+
+# "error id=524 msg=client\sis\sflooding extra_msg=please\swait\s3\sseconds"
+ERROR_FLOODING = "524"
+DEFAULT_FLOOD_WAIT = 3  # segundos si el servidor no indica la espera
+
+
+class FanoutReport:
+    """Resultado de un envío masivo"""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.sent = 0
+        self.delivered = 0
+        self.failures = []
+        self.started_at = time.time()
+        self.elapsed = 0.0
+
+    def add_failure(self, target, reason):
+        self.failures.append((target, reason))
+
+    def finish(self):
+        self.elapsed = time.time() - self.started_at
+
+    @property
+    def rate(self):
+        """Entregas por segundo"""
+        return self.delivered / self.elapsed if self.elapsed > 0 else float(self.delivered)
+
+    def summary(self):
+        return (
+            f"{self.label}: {self.delivered}/{self.total} entregados, "
+            f"{len(self.failures)} fallidos en {self.elapsed:.2f}s ({self.rate:.1f}/s)"
+        )
+
+
+class RateLimiter:
+    """Cubeta de fichas para no superar la protección anti-flood del servidor"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class MessageFanout:
+    """Motor de envío masivo sobre la conexión ServerQuery del bot"""
+
+    def __init__(self, bot, window=None, rate=None):
+        self.bot = bot
+        if window is None:
+            window = FANOUT_ALLOWLISTED_WINDOW if FANOUT_ALLOWLISTED else FANOUT_WINDOW
+        if rate is None:
+            rate = FANOUT_ALLOWLISTED_RATE if FANOUT_ALLOWLISTED else FANOUT_RATE
+        self.window = max(1, window)
+        self.rate = rate
+
+    def send_private(self, client_ids, message):
+        """Mensaje privado a cada cliente (targetmode=1)"""
+        suffix = f" msg={escape(message)}\n".encode('utf-8')
+        commands = [
+            (client_id, b"sendtextmessage targetmode=1 target=" + str(client_id).encode('utf-8') + suffix)
+            for client_id in client_ids
+        ]
+        return self.run("Mensajes privados", commands)
+
+    def send_poke(self, client_ids, message):
+        """Poke a cada cliente"""
+        suffix = f" msg={escape(message)}\n".encode('utf-8')
+        commands = [
+            (client_id, b"clientpoke clid=" + str(client_id).encode('utf-8') + suffix)
+            for client_id in client_ids
+        ]
+        return self.run("Pokes", commands)
+
+    def send_templated(self, clients, template):
+        """Mensaje privado personalizado con los datos de cada cliente
+
+        La plantilla usa los campos de clientlist, por ejemplo
+        "Hola {client_nickname}". Los valores de `clients` deben venir ya
+        sin escapar (registros de parse_response); si la plantilla no se
+        puede aplicar a un cliente se envía el texto tal cual.
+        """
+        commands = []
+        for client in clients:
+            client_id = client.get('clid')
+            if not client_id:
+                continue
+            try:
+                text = template.format_map(_DefaultDict(client))
+            except (ValueError, KeyError, IndexError, AttributeError, TypeError):
+                text = template
+            message = escape(text)
+            commands.append((
+                client_id,
+                f"sendtextmessage targetmode=1 target={client_id} msg={message}\n".encode('utf-8')
+            ))
+        return self.run("Mensajes personalizados", commands)
+
+    def send_channel(self, message):
+        """Mensaje al canal actual del bot (targetmode=2)
+
+        El servidor ignora `target` en este modo y siempre envía al canal
+        donde está el bot, así que no se puede elegir otro canal.
+        """
+        command = f"sendtextmessage targetmode={TARGET_CHANNEL} target=0 msg={escape(message)}\n"
+        return self.run("Mensaje de canal", [("canal", command.encode('utf-8'))])
+
+    def send_server(self, message):
+        """Mensaje a todo el servidor (targetmode=3)"""
+        server_id = self.bot.server_id or 0
+        command = f"sendtextmessage targetmode={TARGET_SERVER} target={server_id} msg={escape(message)}\n"
+        return self.run("Mensaje de servidor", [(server_id, command.encode('utf-8'))])
+
+    def run(self, label, commands):
+        """Enviar los comandos ya construidos y emparejar cada respuesta
+
+        El servidor responde en orden, así que cada línea "error id=" se
+        asocia al comando más antiguo todavía en vuelo. Si el servidor
+        avisa de flood (error 524) se deja de enviar, se espera lo que
+        indique y se reintentan esos objetivos a la mitad de velocidad.
+        """
+        report = FanoutReport(label, len(commands))
+        sock = self.bot.socket
+        if not sock:
+            for target, _ in commands:
+                report.add_failure(target, "sin conexión")
+            report.finish()
+            return report
+
+        window = self.window
+        limiter = RateLimiter(self.rate, window)
+        # (objetivo, comando, intentos rechazados por flood)
+        pending = deque((target, data, 0) for target, data in commands)
+        in_flight = deque()
+        flooded = []
+        flood_wait = 0
+        events = []
+
+        try:
+            while pending or in_flight or flooded:
+                if flood_wait and not in_flight:
+                    # Ya llegaron todas las respuestas pendientes: esperar lo
+                    # que pide el servidor y reintentar más despacio
+                    self.bot.logger.warning(
+                        f"🐢 Anti-flood del servidor en {label}: esperando {flood_wait}s "
+                        f"y reintentando {len(flooded)} objetivos"
+                    )
+                    pending.extendleft(reversed(flooded))
+                    flooded = []
+                    time.sleep(flood_wait)
+                    flood_wait = 0
+                    window = max(1, window // 2)
+                    limiter = RateLimiter(max(1.0, limiter.rate / 2), window)
+                    limiter.tokens = 0.0
+
+                # Llenar la ventana de comandos en vuelo (salvo tras un aviso de flood)
+                while pending and not flood_wait and len(in_flight) < window:
+                    item = pending.popleft()
+                    limiter.acquire()
+                    sock.sendall(item[1])
+                    in_flight.append(item)
+                    report.sent += 1
+
+                if not in_flight:
+                    continue
+
+                # Leer a través del búfer del bot para no perder líneas a medias
+                line = self.bot.read_line(FANOUT_REPLY_TIMEOUT)
+                if line.startswith("error id="):
+                    target, data, attempts = in_flight.popleft()
+                    error_id, error_msg = parse_error_line(line)
+                    if error_id == "0":
+                        report.delivered += 1
+                    elif error_id == ERROR_FLOODING and attempts < FANOUT_FLOOD_RETRIES:
+                        flooded.append((target, data, attempts + 1))
+                        flood_wait = max(flood_wait, _flood_wait(line))
+                    else:
+                        report.add_failure(target, error_msg or f"error {error_id}")
+                elif line.startswith("notify"):
+                    # Los eventos se procesan al terminar para no mezclar respuestas
+                    events.append(line)
+
+        except OSError as e:
+            # Incluye socket.timeout: las respuestas aún en vuelo llegarían
+            # tarde y se confundirían con las de los siguientes comandos,
+            # así que se fuerza una reconexión limpia
+            self.bot.logger.error(f"Error en envío masivo ({label}): {e}")
+            for target, _, _ in list(in_flight) + flooded + list(pending):
+                report.add_failure(target, str(e) or "sin respuesta")
+            self.bot.connected = False
+
+        report.finish()
+
+        for event in events:
+            self.bot.handle_event(event)
+
+        return report
+
+
+def _flood_wait(line):
+    """Segundos de espera indicados en un "error id=524" (extra_msg)"""
+    extra = parse_record(line).get('extra_msg', '')
+    match = re.search(r"wait (\d+)", extra)
+    return int(match.group(1)) if match else DEFAULT_FLOOD_WAIT
+
+
+def has_template_fields(text):
+    """Verificar si el texto tiene campos con nombre como {client_nickname}
+
+    Llaves sueltas o campos posicionales ("use {}", "{0}") no cuentan como
+    plantilla y el texto se envía tal cual.
+    """
+    try:
+        fields = [field for _, field, _, _ in string.Formatter().parse(text) if field is not None]
+    except ValueError:
+        return False
+    return bool(fields) and all(
+        field.split('.')[0].split('[')[0].isidentifier() for field in fields
+    )
+
+
+class _DefaultDict(dict):
+    """Diccionario que deja vacíos los campos que no existen en la plantilla"""
+
+    def __missing__(self, key):
+        return ""
@@ -0,0 +1,193 @@
+"""
+Trabajos masivos con punto de control para el bot de TeamSpeak 3
+
+Un trabajo guarda la lista de objetivos resuelta al crearse y el estado de
+cada objetivo, de modo que si la conexión se pierde a mitad de camino se
+puede continuar después de reconectar sin repetir lo ya hecho.
+"""
+
+import time
+from collections import OrderedDict
+from serverquery import parse_response
+
+# Estados de cada objetivo
+TARGET_PENDING = "pendiente"
+TARGET_DONE = "completado"
+TARGET_FAILED = "fallido"
+TARGET_SKIPPED = "omitido"
+
+# Estados del trabajo
+JOB_RUNNING = "en curso"
+JOB_INTERRUPTED = "interrumpido"
+JOB_FINISHED = "terminado"
+
+# Trabajos terminados que se conservan para consulta
+MAX_FINISHED_JOBS = 20
+
+
+class MassJob:
+    """Operación masiva sobre un conjunto fijo de clientes"""
+
+    def __init__(self, job_id, name, targets, build_command, action_label):
+        self.job_id = job_id
+        self.name = name
+        self.build_command = build_command
+        self.action_label = action_label
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = JOB_RUNNING
+        self.resumes = 0
+
+        # Objetivos resueltos una sola vez: clid -> datos del cliente
+        self.targets = OrderedDict()
+        self.target_state = {}
+        for client in targets:
+            client_id = client.get('clid')
+            if client_id and client_id not in self.targets:
+                self.targets[client_id] = client
+                self.target_state[client_id] = TARGET_PENDING
+
+    def pending_targets(self):
+        """Objetivos que aún no se han procesado"""
+        return [clid for clid, state in self.target_state.items() if state == TARGET_PENDING]
+
+    def verify_targets(self, bot, online):
+        """Omitir los objetivos pendientes cuyo clid ya es de otro cliente
+
+        `online` relaciona cada clid conectado con su cldbid. Tras una
+        reconexión un clid puede haberse reasignado, así que solo se sigue
+        con los objetivos cuyo cldbid coincide con el registrado.
+        """
+        for client_id in self.pending_targets():
+            client = self.targets[client_id]
+            recorded = client.get('client_database_id')
+            if recorded is None or online.get(client_id) != recorded:
+                self.target_state[client_id] = TARGET_SKIPPED
+                bot.logger.info(
+                    f"⏭️ Trabajo #{self.job_id}: {client.get('client_nickname', 'Desconocido')} "
+                    f"ya no está conectado con el clid {client_id}, se omite"
+                )
+
+    def run(self, bot):
+        """Procesar los objetivos pendientes
+
+        Devuelve False si la conexión se perdió; el trabajo queda
+        interrumpido y se puede continuar más tarde con otra llamada.
+        """
+        self.status = JOB_RUNNING
+
+        for client_id in self.pending_targets():
+            client_name = self.targets[client_id].get('client_nickname', 'Desconocido')
+            response = bot.send_command(self.build_command(client_id))
+
+            if not response:
+                # Sin respuesta o conexión colgada: guardar el punto de control
+                # y dejar el objetivo pendiente
+                self.status = JOB_INTERRUPTED
+                bot.logger.warning(
+                    f"⏸️ Trabajo #{self.job_id} ({self.name}) interrumpido - "
+                    f"{len(self.pending_targets())} objetivos pendientes"
+                )
+                return False
+
+            if "error id=0" in response:
+                self.target_state[client_id] = TARGET_DONE
+                bot.logger.info(f"{self.action_label} {client_name}")
+            else:
+                # Solo un error explícito del servidor cuenta como fallo
+                self.target_state[client_id] = TARGET_FAILED
+                bot.logger.warning(f"❌ Trabajo #{self.job_id}: fallo con {client_name}")
+
+        self.status = JOB_FINISHED
+        self.finished_at = time.time()
+        return True
+
+    def progress(self):
+        """Resumen del progreso del trabajo"""
+        counts = {TARGET_PENDING: 0, TARGET_DONE: 0, TARGET_FAILED: 0, TARGET_SKIPPED: 0}
+        for state in self.target_state.values():
+            counts[state] += 1
+
+        return {
+            'job_id': self.job_id,
+            'name': self.name,
+            'status': self.status,
+            'total': len(self.targets),
+            'done': counts[TARGET_DONE],
+            'failed': counts[TARGET_FAILED],
+            'pending': counts[TARGET_PENDING],
+            'skipped': counts[TARGET_SKIPPED],
+            'resumes': self.resumes,
+        }
+
+
+class JobManager:
+    """Registro de trabajos masivos del bot"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.jobs = OrderedDict()
+        self.next_job_id = 1
+
+    def start(self, name, targets, build_command, action_label):
+        """Crear un trabajo y ejecutarlo inmediatamente"""
+        job = MassJob(self.next_job_id, name, targets, build_command, action_label)
+        self.next_job_id += 1
+        self.jobs[job.job_id] = job
+        self._prune()
+
+        self.bot.logger.info(f"📦 Trabajo #{job.job_id} ({name}) creado con {len(job.targets)} objetivos")
+        job.run(self.bot)
+        return job
+
+    def interrupted_jobs(self):
+        """Trabajos que quedaron a medias"""
+        return [job for job in self.jobs.values() if job.status == JOB_INTERRUPTED]
+
+    def resume_all(self):
+        """Continuar los trabajos interrumpidos desde su punto de control
+
+        Devuelve False si alguno volvió a interrumpirse.
+        """
+        jobs = self.interrupted_jobs()
+        if not jobs:
+            return True
+
+        # Una sola consulta para comprobar que cada clid sigue siendo el mismo cliente
+        online = self._online_clients()
+        if online is None:
+            return False
+
+        for job in jobs:
+            job.resumes += 1
+            job.verify_targets(self.bot, online)
+            self.bot.logger.info(
+                f"▶️ Reanudando trabajo #{job.job_id} ({job.name}) - "
+                f"{len(job.pending_targets())} objetivos pendientes"
+            )
+            if not job.run(self.bot):
+                return False
+            self.bot.logger.info(f"✅ Trabajo #{job.job_id} ({job.name}) completado tras reanudar")
+        return True
+
+    def _online_clients(self):
+        """Relación clid -> cldbid de los clientes conectados (None si falla)"""
+        response = self.bot.send_command("clientlist")
+        if not response or "error id=0" not in response:
+            return None
+        return {record.get('clid'): record.get('client_database_id')
+                for record in parse_response(response)}
+
+    def get(self, job_id):
+        """Obtener un trabajo por su ID"""
+        return self.jobs.get(job_id)
+
+    def progress(self):
+        """Progreso de todos los trabajos registrados"""
+        return [job.progress() for job in self.jobs.values()]
+
+    def _prune(self):
+        """Descartar los trabajos terminados más antiguos"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.status == JOB_FINISHED]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
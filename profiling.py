@@ -0,0 +1,185 @@
+"""
+Perfilado bajo demanda para el bot de TeamSpeak 3
+
+Permite activar y desactivar cProfile y tracemalloc con el bot en marcha
+(por señal o por comando de chat) alrededor de las funciones instrumentadas,
+y vuelca los resultados a ficheros con un resumen de las N entradas
+principales.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from functools import wraps
+from config import PROFILE_DIR, PROFILE_TOP_N, PROFILE_TRACE_FRAMES
+
+# Métodos del bot que se instrumentan
+INSTRUMENTED_METHODS = [
+    'send_command',
+    'handle_event',
+    'command_mass_poke',
+    'command_mass_move',
+    'command_mass_kick',
+    'command_mass_message',
+    'command_announce',
+    'command_channel_message',
+]
+
+
+class _Session:
+    """Estado de una sesión de perfilado"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.depth = 0
+        self.started_at = time.time()
+        self.calls = defaultdict(int)
+        self.total_time = defaultdict(float)
+        self.memory_delta = defaultdict(int)
+        self.start_snapshot = None
+        # Si fue esta sesión la que activó tracemalloc (y debe apagarlo)
+        self.owns_tracemalloc = False
+
+
+class RuntimeProfiler:
+    """Perfilador que se puede encender y apagar en tiempo de ejecución"""
+
+    def __init__(self, logger, output_dir=PROFILE_DIR, top_n=PROFILE_TOP_N,
+                 trace_frames=PROFILE_TRACE_FRAMES):
+        self.logger = logger
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.trace_frames = trace_frames
+        self.session = None
+
+    @property
+    def active(self):
+        return self.session is not None
+
+    def instrument(self, bot):
+        """Envolver los métodos del bot y actualizar la tabla de comandos"""
+        for name in INSTRUMENTED_METHODS:
+            setattr(bot, name, self.wrap(name, getattr(bot, name)))
+
+        for command, func in bot.commands.items():
+            name = getattr(func, '__name__', None)
+            if name in INSTRUMENTED_METHODS:
+                bot.commands[command] = getattr(bot, name)
+
+    def wrap(self, name, func):
+        """Medir `func` solo mientras haya una sesión activa"""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            session = self.session
+            if session is None:
+                return func(*args, **kwargs)
+
+            # Solo la llamada más externa enciende y apaga cProfile
+            outermost = session.depth == 0
+            session.depth += 1
+            memory_before = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            if outermost:
+                session.profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if outermost:
+                    session.profile.disable()
+                session.depth -= 1
+                session.calls[name] += 1
+                session.total_time[name] += time.perf_counter() - started
+                session.memory_delta[name] += tracemalloc.get_traced_memory()[0] - memory_before
+
+        return wrapper
+
+    def start(self):
+        """Iniciar una sesión de perfilado"""
+        if self.active:
+            self.logger.info("🔬 El perfilado ya está activo")
+            return False
+
+        session = _Session()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+            session.owns_tracemalloc = True
+        session.start_snapshot = tracemalloc.take_snapshot()
+        self.session = session
+
+        self.logger.info("🔬 Perfilado iniciado (cProfile + tracemalloc)")
+        return True
+
+    def stop(self):
+        """Detener la sesión y volcar los resultados
+
+        Devuelve la ruta del resumen, o None si no había sesión.
+        """
+        session = self.session
+        if session is None:
+            self.logger.info("🔬 El perfilado no está activo")
+            return None
+
+        self.session = None
+        session.profile.disable()
+        end_snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if session.owns_tracemalloc:
+            # No apagar un rastreo que ya estaba activo (p. ej. PYTHONTRACEMALLOC)
+            tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        profile_path = os.path.join(self.output_dir, f"profile-{stamp}.prof")
+        summary_path = os.path.join(self.output_dir, f"profile-{stamp}.txt")
+
+        session.profile.dump_stats(profile_path)
+        summary = self._summary(session, end_snapshot, current, peak)
+        with open(summary_path, 'w', encoding='utf-8') as summary_file:
+            summary_file.write(summary)
+
+        self.logger.info(f"🔬 Perfilado detenido - resultados en {summary_path} y {profile_path}")
+        return summary_path
+
+    def toggle(self):
+        """Alternar entre iniciar y detener (para la señal)"""
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def _summary(self, session, end_snapshot, current, peak):
+        out = io.StringIO()
+        duration = time.time() - session.started_at
+
+        out.write(f"Sesión de perfilado: {duration:.1f}s\n")
+        out.write(f"Memoria trazada: actual {current / 1024:.1f} KiB, pico {peak / 1024:.1f} KiB\n\n")
+
+        out.write("== Funciones instrumentadas ==\n")
+        for name in sorted(session.calls, key=lambda n: session.total_time[n], reverse=True):
+            out.write(
+                f"{name}: {session.calls[name]} llamadas, {session.total_time[name]:.3f}s, "
+                f"{session.memory_delta[name] / 1024:+.1f} KiB\n"
+            )
+
+        out.write(f"\n== cProfile (top {self.top_n} por tiempo acumulado) ==\n")
+        try:
+            stats = pstats.Stats(session.profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+        except TypeError:
+            # Sin llamadas registradas no hay estadísticas que mostrar
+            out.write("Sin datos\n")
+
+        out.write(f"\n== tracemalloc (top {self.top_n} crecimiento por línea) ==\n")
+        for stat in end_snapshot.compare_to(session.start_snapshot, 'lineno')[:self.top_n]:
+            out.write(f"{stat}\n")
+
+        out.write(f"\n== tracemalloc (top {self.top_n} memoria viva por línea) ==\n")
+        for stat in end_snapshot.statistics('lineno')[:self.top_n]:
+            out.write(f"{stat}\n")
+
+        return out.getvalue()
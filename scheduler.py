@@ -0,0 +1,126 @@
+"""
+Planificador de tareas periódicas para el bot de TeamSpeak 3
+
+Las tareas se guardan en un montículo ordenado por su próxima ejecución, así
+que añadir o ejecutar una tarea cuesta O(log n) y el bucle principal puede
+dormir justo hasta el siguiente vencimiento.
+"""
+
+import heapq
+import itertools
+import random
+import time
+from config import SCHEDULER_LATE_THRESHOLD
+
+
+class ScheduledJob:
+    """Tarea que se repite cada cierto intervalo"""
+
+    def __init__(self, name, interval, func, next_run):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.next_run = next_run
+        self.cancelled = False
+        self.runs = 0
+        self.late_runs = 0
+        self.max_lag = 0.0
+        self.errors = 0
+
+    def stats(self):
+        """Resumen de ejecuciones de la tarea"""
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'runs': self.runs,
+            'late_runs': self.late_runs,
+            'max_lag': self.max_lag,
+            'errors': self.errors,
+        }
+
+
+class Scheduler:
+    """Montículo de tareas periódicas"""
+
+    def __init__(self, logger, late_threshold=SCHEDULER_LATE_THRESHOLD):
+        self.logger = logger
+        self.late_threshold = late_threshold
+        self.heap = []
+        self.jobs = {}
+        self.counter = itertools.count()
+
+    def every(self, name, interval, func, jitter=0.0):
+        """Programar una tarea cada `interval` segundos
+
+        La primera ejecución se desplaza un valor aleatorio entre 0 y
+        `jitter` segundos para que las tareas no venzan todas a la vez.
+        """
+        if name in self.jobs:
+            self.cancel(name)
+
+        next_run = time.monotonic() + interval + random.uniform(0, jitter)
+        job = ScheduledJob(name, interval, func, next_run)
+        self.jobs[name] = job
+        self._push(job)
+        return job
+
+    def cancel(self, name):
+        """Cancelar una tarea; se descarta del montículo al llegar su turno"""
+        job = self.jobs.pop(name, None)
+        if job:
+            job.cancelled = True
+
+    def time_until_next(self, now=None):
+        """Segundos hasta el próximo vencimiento (None si no hay tareas)"""
+        self._drop_cancelled()
+        if not self.heap:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self.heap[0][0] - now)
+
+    def run_pending(self, now=None):
+        """Ejecutar las tareas vencidas y reprogramarlas"""
+        if now is None:
+            now = time.monotonic()
+
+        while self.heap and self.heap[0][0] <= now:
+            _, _, job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+
+            # Medir el retraso en el momento real de arranque: una tarea
+            # anterior del mismo lote puede haber bloqueado (p. ej. reconectar)
+            lag = time.monotonic() - job.next_run
+            job.max_lag = max(job.max_lag, lag)
+            if lag > self.late_threshold:
+                job.late_runs += 1
+                self.logger.warning(f"⏰ Tarea '{job.name}' ejecutada con {lag:.2f}s de retraso")
+
+            job.runs += 1
+            try:
+                job.func()
+            except Exception as e:
+                job.errors += 1
+                self.logger.error(f"Error en tarea programada '{job.name}': {e}")
+
+            if job.cancelled:
+                continue
+
+            # Mantener la cadencia; si vamos más de un intervalo atrasados, no acumular
+            job.next_run += job.interval
+            current = time.monotonic()
+            if job.next_run <= current:
+                job.next_run = current + job.interval
+            self._push(job)
+
+    def stats(self):
+        """Resumen de todas las tareas programadas"""
+        return [job.stats() for job in self.jobs.values()]
+
+    def _push(self, job):
+        heapq.heappush(self.heap, (job.next_run, next(self.counter), job))
+
+    def _drop_cancelled(self):
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
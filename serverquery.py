@@ -0,0 +1,89 @@
+"""
+Utilidades del protocolo ServerQuery de TeamSpeak 3
+"""
+
+# Caracteres que el protocolo exige escapar (el orden importa: "\\" primero)
+ESCAPE_MAP = [
+    ("\\", "\\\\"),
+    ("/", "\\/"),
+    (" ", "\\s"),
+    ("|", "\\p"),
+    ("\a", "\\a"),
+    ("\b", "\\b"),
+    ("\f", "\\f"),
+    ("\n", "\\n"),
+    ("\r", "\\r"),
+    ("\t", "\\t"),
+    ("\v", "\\v"),
+]
+
+UNESCAPE_MAP = {escaped[1]: raw for raw, escaped in ESCAPE_MAP}
+
+
+def escape(text):
+    """Escapar un valor para enviarlo en un comando"""
+    for raw, escaped in ESCAPE_MAP:
+        text = text.replace(raw, escaped)
+    return text
+
+
+def unescape(text):
+    """Deshacer el escape de un valor recibido del servidor"""
+    if "\\" not in text:
+        return text
+
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text):
+            result.append(UNESCAPE_MAP.get(text[i + 1], text[i + 1]))
+            i += 2
+        else:
+            result.append(char)
+            i += 1
+    return "".join(result)
+
+
+def parse_error_line(line):
+    """Extraer id y mensaje de una línea "error id=... msg=..." """
+    error_id = None
+    message = ""
+    for part in line.split():
+        if part.startswith("id="):
+            error_id = part.split("=", 1)[1]
+        elif part.startswith("msg="):
+            message = unescape(part.split("=", 1)[1])
+    return error_id, message
+
+
+def parse_record(text):
+    """Convertir "clave=valor clave2=valor2" en un diccionario"""
+    record = {}
+    for part in text.split():
+        if '=' in part:
+            key, value = part.split('=', 1)
+            record[key] = unescape(value)
+        else:
+            record[part] = ""
+    return record
+
+
+def parse_response(response):
+    """Convertir la respuesta de un comando en una lista de registros
+
+    Ignora la línea final "error id=..." y separa los registros por "|".
+    """
+    records = []
+    for line in response.splitlines():
+        line = line.strip()
+        if not line or line.startswith("error id="):
+            continue
+        records.extend(parse_record(item) for item in line.split("|"))
+    return records
+
+
+def parse_event(line):
+    """Separar una notificación en su nombre y sus registros"""
+    name, _, data = line.strip().partition(" ")
+    return name, [parse_record(item) for item in data.split("|")] if data else []
@@ -3,25 +3,42 @@ Bot simple de TeamSpeak 3 usando socket directo para ServerQuery
 """
 
 import socket
+import signal
 import time
 import logging
 import sys
 import threading
 import re
+from mass_jobs import JobManager, JOB_INTERRUPTED
+from fanout import MessageFanout, has_template_fields
+from scheduler import Scheduler
+from client_lookup import ClientLookup
+from serverquery import parse_response, parse_event, unescape
+from profiling import RuntimeProfiler
 from config import (
     TS3_HOST, TS3_PORT, TS3_QUERY_PORT, 
     TS3_USERNAME, TS3_PASSWORD,
-    RECONNECT_DELAY, MAX_RECONNECT_ATTEMPTS
+    RECONNECT_DELAY, MAX_RECONNECT_ATTEMPTS,
+    KEEPALIVE_INTERVAL, STATUS_INTERVAL, SCHEDULER_JITTER,
+    ADMIN_UIDS
 )
 
 class SimpleTeamSpeakBot:
-    def __init__(self):
+    def __init__(self, host=TS3_HOST, query_port=TS3_QUERY_PORT, reconnect_delay=RECONNECT_DELAY):
+        self.host = host
+        self.query_port = query_port
+        self.reconnect_delay = reconnect_delay
         self.socket = None
+        self.read_buffer = b""
         self.connected = False
         self.reconnect_attempts = 0
         self.server_id = None
         self.bot_client_id = None
         self.listening_events = False
+        self.running = False
+        self.jobs = JobManager(self)
+        self.fanout = MessageFanout(self)
+        self.lookup = ClientLookup(self)
         
         # Configurar logging
         logging.basicConfig(
@@ -32,61 +49,83 @@ class SimpleTeamSpeakBot:
             ]
         )
         self.logger = logging.getLogger(__name__)
+        self.scheduler = Scheduler(self.logger)
         
         # Comandos disponibles
         self.commands = {
             '!mp': self.command_mass_poke,
             '!mm': self.command_mass_move,
             '!mk': self.command_mass_kick,
+            '!msg': self.command_mass_message,
+            '!anuncio': self.command_announce,
+            '!canal': self.command_channel_message,
+            '!jobs': self.command_jobs,
+            '!whois': self.command_whois,
+            '!prof': self.command_profile,
             '!test': self.command_test_clients
         }
+        
+        # Perfilado bajo demanda (inactivo hasta que se pide)
+        self.profiler = RuntimeProfiler(self.logger)
+        self.profiler.instrument(self)
     
     def send_command(self, command):
-        """Enviar comando al servidor TeamSpeak"""
+        """Enviar comando al servidor TeamSpeak
+        
+        Devuelve None si la conexión se perdió o el servidor no respondió a
+        tiempo; en ambos casos la conexión se marca como perdida.
+        """
+        # Eventos que llegan mezclados con la respuesta (por ejemplo el
+        # notifyclientleftview que precede a la respuesta de clientkick)
+        events = []
         try:
             if not self.socket:
                 return None
             
             full_command = command + "\n\r"
-            self.socket.send(full_command.encode('utf-8'))
+            self.socket.sendall(full_command.encode('utf-8'))
             
-            # Leer respuesta
-            response = ""
+            # Leer respuesta hasta la línea "error id=..."
+            response_lines = []
             while True:
-                self.socket.settimeout(2)  # Timeout corto para no bloquear
-                try:
-                    data = self.socket.recv(1024).decode('utf-8')
-                    response += data
-                    if "error id=" in response:
-                        break
-                except socket.timeout:
-                    # Si hay timeout, puede que sea un evento
-                    if response and "notify" in response:
-                        # Es un evento, procesarlo
-                        self.handle_event(response)
-                        response = ""
-                        continue
+                line = self.read_line(2)  # Timeout corto para no bloquear
+                if line.startswith("notify"):
+                    events.append(line)
+                    continue
+                if line:
+                    response_lines.append(line)
+                if line.startswith("error id="):
                     break
             
-            return response.strip()
+            return "\n".join(response_lines)
             
+        except socket.timeout:
+            # Sin respuesta: la conexión está colgada y una respuesta tardía
+            # desordenaría las siguientes, así que se fuerza la reconexión
+            self.logger.error(f"Sin respuesta del servidor al comando: {command.split()[0]}")
+            self.connected = False
+            return None
         except Exception as e:
             self.logger.error(f"Error enviando comando: {e}")
+            self.connected = False
             return None
-    
-
+        finally:
+            # Procesar los eventos una vez leída la respuesta completa
+            for event in events:
+                self.handle_event(event)
     
     def connect(self):
         """Conectar al servidor TeamSpeak 3"""
         try:
-            self.logger.info(f"Conectando a {TS3_HOST}:{TS3_QUERY_PORT}...")
+            self.logger.info(f"Conectando a {self.host}:{self.query_port}...")
             
             # Crear socket
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(10)
+            self.read_buffer = b""
             
             # Conectar
-            self.socket.connect((TS3_HOST, TS3_QUERY_PORT))
+            self.socket.connect((self.host, self.query_port))
             
             # Leer mensaje de bienvenida
             welcome = self.socket.recv(1024).decode('utf-8')
@@ -172,6 +211,12 @@ class SimpleTeamSpeakBot:
                 print("  !mp - Enviar poke a todos los usuarios")
                 print("  !mm - Mover todos al canal del comando")
                 print("  !mk - Expulsar a todos del servidor")
+                print("  !msg <texto> - Mensaje privado a todos ({client_nickname} = apodo)")
+                print("  !anuncio <texto> - Mensaje a todo el servidor")
+                print("  !canal <texto> - Mensaje al canal donde está el bot")
+                print("  !jobs [id] - Ver progreso de operaciones masivas (o el detalle de una)")
+                print("  !whois <apodo|uid|id> - Buscar un cliente")
+                print("  !prof <start|stop> - Perfilado del bot (solo admins)")
                 print("  !test - Ver lista de usuarios (debug)")
                 print("-" * 30)
                 
@@ -224,6 +269,8 @@ class SimpleTeamSpeakBot:
             self.send_command("servernotifyregister event=textchannel")
             # Registrar eventos de chat privado
             self.send_command("servernotifyregister event=textprivate")
+            # Registrar entradas y salidas de clientes (mantienen la caché de búsqueda)
+            self.send_command("servernotifyregister event=server")
             
             self.listening_events = True
             self.logger.info("✅ Eventos registrados - escuchando comandos")
@@ -232,39 +279,30 @@ class SimpleTeamSpeakBot:
             self.logger.error(f"Error registrando eventos: {e}")
     
     def get_all_clients(self):
-        """Obtener lista de todos los clientes conectados (excluyendo solo el bot actual)"""
+        """Obtener lista de todos los clientes conectados (excluyendo solo el bot actual)
+        
+        Los valores vienen ya sin escapar (por ejemplo "John Doe" y no
+        "John\\sDoe"), listos para mostrar o usar en plantillas.
+        """
         try:
-            clients_info = self.send_command("clientlist")
+            clients_info = self.send_command("clientlist -uid")
             clients = []
             
             self.logger.info(f"Debug - Respuesta clientlist: {clients_info}")
             
             if clients_info and "error id=0" in clients_info:
-                # Parsear respuesta que puede venir en una sola línea con múltiples clientes
-                if "clid=" in clients_info:
-                    # Dividir por clid= para obtener cada cliente
-                    client_blocks = clients_info.split("clid=")[1:]  # Ignorar la parte antes del primer clid=
+                # Cada cliente es un registro separado por "|"
+                for client_data in parse_response(clients_info):
+                    self.logger.info(f"Debug - Cliente encontrado: {client_data}")
                     
-                    for block in client_blocks:
-                        client_data = {}
-                        # El primer valor es el ID del cliente
-                        parts = block.split()
-                        if parts:
-                            client_data['clid'] = parts[0]
-                            
-                            # Procesar el resto de los parámetros
-                            for part in parts:
-                                if '=' in part:
-                                    key, value = part.split('=', 1)
-                                    client_data[key] = value
-                        
-                        self.logger.info(f"Debug - Cliente encontrado: {client_data}")
-                        
-                        # Incluir todos los usuarios reales (client_type=0) excepto el bot actual
-                        if (client_data.get('client_type') == '0' and 
-                            client_data.get('clid') != self.bot_client_id):
-                            clients.append(client_data)
-                            self.logger.info(f"Debug - Cliente agregado: {client_data.get('client_nickname')} (ID: {client_data.get('clid')})")
+                    # Aprovechar la lista completa para actualizar la caché de búsqueda
+                    self.lookup.observe(client_data)
+                    
+                    # Incluir todos los usuarios reales (client_type=0) excepto el bot actual
+                    if (client_data.get('client_type') == '0' and 
+                        client_data.get('clid') != self.bot_client_id):
+                        clients.append(client_data)
+                        self.logger.info(f"Debug - Cliente agregado: {client_data.get('client_nickname')} (ID: {client_data.get('clid')})")
             
             self.logger.info(f"Debug - Total clientes válidos encontrados: {len(clients)}")
             return clients
@@ -273,83 +311,230 @@ class SimpleTeamSpeakBot:
             self.logger.error(f"Error obteniendo lista de clientes: {e}")
             return []
     
-    def command_mass_poke(self, invoker_id, channel_id):
+    def command_mass_poke(self, invoker_id, channel_id, args=None):
         """Comando !mp - Enviar poke a todos los usuarios"""
         try:
             clients = self.get_all_clients()
-            poked_count = 0
+            client_ids = [client.get('clid') for client in clients if client.get('clid')]
             
-            for client in clients:
-                client_id = client.get('clid')
-                client_name = client.get('client_nickname', 'Desconocido')
-                
-                if client_id:
-                    # Enviar poke al cliente
-                    poke_response = self.send_command(f"clientpoke clid={client_id} msg=¡Poke\smásivo\sdel\sbot!")
-                    
-                    if poke_response and "error id=0" in poke_response:
-                        poked_count += 1
-                        self.logger.info(f"👉 Poke enviado a {client_name}")
-                    else:
-                        self.logger.warning(f"❌ No se pudo hacer poke a {client_name}")
+            report = self.fanout.send_poke(client_ids, "¡Poke másivo del bot!")
+            
+            names = {client.get('clid'): client.get('client_nickname', 'Desconocido') for client in clients}
+            for client_id, reason in report.failures:
+                self.logger.warning(f"❌ No se pudo hacer poke a {names.get(client_id, client_id)}: {reason}")
             
-            self.logger.info(f"✅ Comando !mp ejecutado - {poked_count} usuarios recibieron poke")
+            self.logger.info(f"✅ Comando !mp ejecutado - {report.summary()}")
             
         except Exception as e:
             self.logger.error(f"Error ejecutando comando !mp: {e}")
     
-    def command_mass_move(self, invoker_id, channel_id):
-        """Comando !mm - Mover todos los usuarios al canal del comando"""
+    def command_mass_message(self, invoker_id, channel_id, args=None):
+        """Comando !msg - Enviar un mensaje privado a todos los usuarios"""
         try:
+            if not args:
+                self.logger.info("⚠️ Uso: !msg <texto>")
+                return
+            
+            text = " ".join(args)
             clients = self.get_all_clients()
-            moved_count = 0
             
-            for client in clients:
-                client_id = client.get('clid')
-                client_name = client.get('client_nickname', 'Desconocido')
-                current_channel = client.get('cid')
-                
-                # Solo mover si no está ya en el canal de destino
-                if client_id and current_channel != channel_id:
-                    move_response = self.send_command(f"clientmove clid={client_id} cid={channel_id}")
-                    
-                    if move_response and "error id=0" in move_response:
-                        moved_count += 1
-                        self.logger.info(f"🚶 {client_name} movido al canal {channel_id}")
-                    else:
-                        self.logger.warning(f"❌ No se pudo mover a {client_name}")
+            # Con campos como {client_nickname} cada usuario recibe su propio texto
+            if has_template_fields(text):
+                report = self.fanout.send_templated(clients, text)
+            else:
+                report = self.fanout.send_private([client.get('clid') for client in clients if client.get('clid')], text)
+            
+            for client_id, reason in report.failures:
+                self.logger.warning(f"❌ No se pudo enviar mensaje a {client_id}: {reason}")
+            
+            self.logger.info(f"✅ Comando !msg ejecutado - {report.summary()}")
+            
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !msg: {e}")
+    
+    def command_announce(self, invoker_id, channel_id, args=None):
+        """Comando !anuncio - Enviar un mensaje a todo el servidor"""
+        try:
+            if not args:
+                self.logger.info("⚠️ Uso: !anuncio <texto>")
+                return
+            
+            report = self.fanout.send_server(" ".join(args))
+            self.logger.info(f"✅ Comando !anuncio ejecutado - {report.summary()}")
+            
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !anuncio: {e}")
+    
+    def command_channel_message(self, invoker_id, channel_id, args=None):
+        """Comando !canal - Enviar un mensaje al canal donde está el bot"""
+        try:
+            if not args:
+                self.logger.info("⚠️ Uso: !canal <texto>")
+                return
+            
+            report = self.fanout.send_channel(" ".join(args))
+            self.logger.info(f"✅ Comando !canal ejecutado - {report.summary()}")
             
-            self.logger.info(f"✅ Comando !mm ejecutado - {moved_count} usuarios movidos")
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !canal: {e}")
+    
+    def command_mass_move(self, invoker_id, channel_id, args=None):
+        """Comando !mm - Mover todos los usuarios al canal del comando"""
+        try:
+            # Solo mover a quien no está ya en el canal de destino
+            clients = [client for client in self.get_all_clients()
+                       if client.get('cid') != channel_id]
+            
+            job = self.jobs.start(
+                "!mm",
+                clients,
+                lambda client_id: f"clientmove clid={client_id} cid={channel_id}",
+                f"🚶 Movido al canal {channel_id}:"
+            )
+            self.finish_job(job, "usuarios movidos")
             
         except Exception as e:
             self.logger.error(f"Error ejecutando comando !mm: {e}")
     
-    def command_mass_kick(self, invoker_id, channel_id):
+    def command_mass_kick(self, invoker_id, channel_id, args=None):
         """Comando !mk - Kick a todos los usuarios del servidor"""
         try:
             clients = self.get_all_clients()
-            kicked_count = 0
             
-            for client in clients:
-                client_id = client.get('clid')
-                client_name = client.get('client_nickname', 'Desconocido')
-                
-                if client_id:
-                    # Kick del servidor (reasonid=5 = kick del servidor)
-                    kick_response = self.send_command(f"clientkick clid={client_id} reasonid=5 reasonmsg=Kick\smásivo\sdel\sbot")
-                    
-                    if kick_response and "error id=0" in kick_response:
-                        kicked_count += 1
-                        self.logger.info(f"👢 {client_name} expulsado del servidor")
-                    else:
-                        self.logger.warning(f"❌ No se pudo expulsar a {client_name}")
-            
-            self.logger.info(f"✅ Comando !mk ejecutado - {kicked_count} usuarios expulsados")
+            # Kick del servidor (reasonid=5 = kick del servidor)
+            job = self.jobs.start(
+                "!mk",
+                clients,
+                lambda client_id: f"clientkick clid={client_id} reasonid=5 reasonmsg=Kick\\smásivo\\sdel\\sbot",
+                "👢 Expulsado del servidor:"
+            )
+            self.finish_job(job, "usuarios expulsados")
             
         except Exception as e:
             self.logger.error(f"Error ejecutando comando !mk: {e}")
     
-    def command_test_clients(self, invoker_id, channel_id):
+    def finish_job(self, job, result_label):
+        """Informar el resultado de un trabajo masivo"""
+        progress = job.progress()
+        
+        if job.status == JOB_INTERRUPTED:
+            # Forzar la reconexión; el trabajo continuará después
+            self.connected = False
+            self.logger.warning(
+                f"⚠️ Comando {job.name} interrumpido - {progress['done']} {result_label}, "
+                f"{progress['pending']} pendientes para después de reconectar"
+            )
+        else:
+            self.logger.info(f"✅ Comando {job.name} ejecutado - {progress['done']} {result_label}")
+    
+    def command_jobs(self, invoker_id, channel_id, args=None):
+        """Comando !jobs - Mostrar el progreso de las operaciones masivas
+        
+        Con un ID (!jobs 3) muestra además el estado de cada objetivo.
+        """
+        try:
+            if args:
+                self.show_job(args[0])
+                return
+            
+            progress_list = self.jobs.progress()
+            if not progress_list:
+                self.logger.info("📦 No hay operaciones masivas registradas")
+                return
+            
+            self.logger.info(f"📦 Operaciones masivas registradas: {len(progress_list)}")
+            for progress in progress_list:
+                self.logger.info(f"  - {self.describe_job(progress)}")
+            
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !jobs: {e}")
+    
+    def show_job(self, job_ref):
+        """Mostrar el progreso de un trabajo y el estado de cada objetivo"""
+        job_ref = job_ref.lstrip('#')
+        if not job_ref.isdigit():
+            self.logger.info("⚠️ Uso: !jobs [id]")
+            return
+        
+        job = self.jobs.get(int(job_ref))
+        if job is None:
+            self.logger.info(f"📦 No existe el trabajo #{job_ref}")
+            return
+        
+        self.logger.info(f"📦 {self.describe_job(job.progress())}")
+        for client_id, client in job.targets.items():
+            self.logger.info(
+                f"  - {client.get('client_nickname', 'Desconocido')} (ID: {client_id}): "
+                f"{job.target_state[client_id]}"
+            )
+    
+    def describe_job(self, progress):
+        """Línea de resumen con el progreso de un trabajo"""
+        return (
+            f"#{progress['job_id']} {progress['name']} [{progress['status']}]: "
+            f"{progress['done']}/{progress['total']} completados, "
+            f"{progress['failed']} fallidos, {progress['skipped']} omitidos, "
+            f"{progress['pending']} pendientes, {progress['resumes']} reanudaciones"
+        )
+    
+    def command_whois(self, invoker_id, channel_id, args=None):
+        """Comando !whois - Buscar un cliente por apodo, uid, cldbid o clid"""
+        try:
+            if not args:
+                self.logger.info("⚠️ Uso: !whois <apodo|uid|id>")
+                return
+            
+            query = " ".join(args)
+            entry = self.lookup.resolve(query)
+            
+            if entry:
+                # Los clientes encontrados en clientdblist no traen clid
+                online_clid = self.lookup.online_clid(entry)
+                self.logger.info(
+                    f"🔎 {query}: {entry['nickname']} (uid: {entry['uid']}, "
+                    f"cldbid: {entry['cldbid']}, clid: {online_clid or 'desconectado'})"
+                )
+            else:
+                self.logger.info(f"🔎 {query}: no encontrado")
+            
+            stats = self.lookup.stats()
+            self.logger.info(
+                f"📈 Caché de búsqueda: {stats['entries']} entradas, "
+                f"{stats['hit_rate']:.0%} aciertos, {stats['fetches']} consultas al servidor"
+            )
+            
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !whois: {e}")
+    
+    def is_admin(self, invoker_id):
+        """Verificar si el cliente está en la lista de administradores"""
+        entry = self.lookup.find_by_clid(invoker_id)
+        return bool(entry and entry['uid'] in ADMIN_UIDS)
+    
+    def command_profile(self, invoker_id, channel_id, args=None):
+        """Comando !prof - Iniciar o detener el perfilado (solo administradores)"""
+        try:
+            if not self.is_admin(invoker_id):
+                self.logger.warning(f"⛔ Cliente {invoker_id} sin permiso para !prof")
+                return
+            
+            action = args[0].lower() if args else "status"
+            if action == "start":
+                self.profiler.start()
+            elif action == "stop":
+                self.profiler.stop()
+            else:
+                state = "activo" if self.profiler.active else "inactivo"
+                self.logger.info(f"🔬 Perfilado {state} - uso: !prof <start|stop>")
+            
+        except Exception as e:
+            self.logger.error(f"Error ejecutando comando !prof: {e}")
+    
+    def handle_profile_signal(self, signum, frame):
+        """Alternar el perfilado al recibir SIGUSR1"""
+        self.profiler.toggle()
+    
+    def command_test_clients(self, invoker_id, channel_id, args=None):
         """Comando !test - Mostrar información de clientes para debugging"""
         try:
             self.logger.info("🔍 Ejecutando comando de test...")
@@ -368,8 +553,9 @@ class SimpleTeamSpeakBot:
             # Limpiar mensaje y extraer solo el comando base
             clean_message = message.strip().lower()
             
-            # Extraer solo el primer palabra (el comando) ignorando argumentos adicionales
+            # Extraer la primera palabra (el comando); el resto son argumentos
             command = clean_message.split()[0] if clean_message else ""
+            args = message.strip().split()[1:]
             
             self.logger.info(f"Debug - Mensaje completo: '{clean_message}'")
             self.logger.info(f"Debug - Comando extraído: '{command}'")
@@ -378,7 +564,7 @@ class SimpleTeamSpeakBot:
             if command in self.commands:
                 command_func = self.commands[command]
                 self.logger.info(f"🎯 Ejecutando comando: {command} por cliente {invoker_id}")
-                command_func(invoker_id, channel_id)
+                command_func(invoker_id, channel_id, args)
             else:
                 self.logger.info(f"⚠️ Comando no reconocido: {command}")
             
@@ -390,6 +576,15 @@ class SimpleTeamSpeakBot:
         try:
             self.logger.info(f"Debug - Evento recibido: {event_data}")
             
+            # Entradas y salidas de clientes
+            for line in event_data.splitlines():
+                if line.startswith("notifycliententerview"):
+                    for record in parse_event(line)[1]:
+                        self.lookup.on_client_enter(record)
+                elif line.startswith("notifyclientleftview"):
+                    for record in parse_event(line)[1]:
+                        self.lookup.on_client_left(record)
+            
             if "notifytextmessage" in event_data:
                 # Parsear evento de mensaje de texto
                 parts = event_data.split()
@@ -404,14 +599,14 @@ class SimpleTeamSpeakBot:
                     if part.startswith("invokerid="):
                         invoker_id = part.split("=")[1]
                     elif part.startswith("msg="):
-                        message = part.split("=", 1)[1].replace("\\s", " ")
+                        message = unescape(part.split("=", 1)[1])
                     elif part.startswith("targetmode="):
                         target_mode = part.split("=")[1]
                         # targetmode=1 = privado, targetmode=2 = canal, targetmode=3 = servidor
                     elif part.startswith("target="):
                         channel_id = part.split("=")[1]
                     elif part.startswith("invokername="):
-                        invoker_name = part.split("=", 1)[1]
+                        invoker_name = unescape(part.split("=", 1)[1])
                 
                 self.logger.info(f"Debug - Mensaje procesado: {message} de {invoker_name} (ID: {invoker_id})")
                 
@@ -436,6 +631,7 @@ class SimpleTeamSpeakBot:
             finally:
                 self.connected = False
                 self.socket = None
+                self.read_buffer = b""
     
     def is_connected(self):
         """Verificar si la conexión está activa"""
@@ -462,10 +658,85 @@ class SimpleTeamSpeakBot:
         # Limpiar conexión anterior
         self.disconnect()
         
+        # Los eventos de entrada/salida perdidos dejan la caché desactualizada
+        self.lookup.clear()
+        
         # Esperar antes de reconectar
-        time.sleep(RECONNECT_DELAY)
+        time.sleep(self.reconnect_delay)
+        
+        if not self.connect():
+            return False
+        
+        # Continuar las operaciones masivas desde su punto de control
+        if not self.jobs.resume_all():
+            self.connected = False
+        return True
+    
+    def check_connection(self):
+        """Tarea programada - verificar la conexión y reconectar si se perdió"""
+        if self.is_connected():
+            return
+        
+        self.logger.warning("⚠️  Conexión perdida, intentando reconectar...")
+        if not self.reconnect():
+            self.logger.error("❌ No se pudo reconectar. Deteniendo bot.")
+            self.running = False
+    
+    def log_status(self):
+        """Tarea programada - mostrar el estado del bot"""
+        stats = self.lookup.stats()
+        self.logger.info(
+            f"📈 Caché de búsqueda: {stats['entries']} entradas, {stats['hit_rate']:.0%} aciertos, "
+            f"{stats['fetches']} consultas ({stats['pages']} páginas), {stats['evictions']} expulsadas"
+        )
+        
+        late_jobs = [job for job in self.scheduler.stats() if job['late_runs']]
+        if late_jobs:
+            details = ", ".join(f"{job['name']} ({job['late_runs']}, máx {job['max_lag']:.2f}s)" for job in late_jobs)
+            self.logger.info(f"💚 Bot funcionando correctamente... tareas con retraso: {details}")
+        else:
+            self.logger.info("💚 Bot funcionando correctamente...")
+    
+    def read_line(self, timeout):
+        """Leer la siguiente línea completa recibida del servidor
+        
+        Los bytes se acumulan en un búfer y solo se decodifican las líneas
+        terminadas, así un carácter multibyte partido entre dos lecturas no
+        se pierde. Lanza socket.timeout si no llega ninguna línea a tiempo y
+        ConnectionError si el servidor cerró la conexión.
+        """
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self.read_buffer:
+            self.socket.settimeout(max(deadline - time.monotonic(), 0.01))
+            data = self.socket.recv(4096)
+            if not data:
+                raise ConnectionError("conexión cerrada por el servidor")
+            self.read_buffer += data
         
-        return self.connect()
+        line, self.read_buffer = self.read_buffer.split(b"\n", 1)
+        return line.decode('utf-8', errors='replace').strip()
+    
+    def has_buffered_line(self):
+        """Verificar si queda una línea completa en el búfer"""
+        return b"\n" in self.read_buffer
+    
+    def wait_for_events(self, timeout):
+        """Esperar eventos del servidor como máximo `timeout` segundos"""
+        try:
+            line = self.read_line(timeout)
+            while True:
+                if line.startswith("notify"):
+                    self.handle_event(line)
+                if not self.socket or not self.has_buffered_line():
+                    break
+                line = self.read_line(0)
+        except socket.timeout:
+            pass  # No hay eventos, toca ejecutar la siguiente tarea
+        except OSError:
+            # Conexión cerrada o rota
+            self.connected = False
+        except Exception as e:
+            self.logger.error(f"Error leyendo eventos: {e}")
     
     def run(self):
         """Ejecutar el bot de forma continua"""
@@ -479,44 +750,37 @@ class SimpleTeamSpeakBot:
         self.logger.info("✅ Bot conectado y ejecutándose...")
         self.logger.info("Presiona Ctrl+C para detener el bot")
         
+        # kill -USR1 <pid> alterna el perfilado sin reiniciar el bot
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.handle_profile_signal)
+        
+        # Tareas periódicas
+        self.scheduler.every("keepalive", KEEPALIVE_INTERVAL, self.check_connection, SCHEDULER_JITTER)
+        self.scheduler.every("estado", STATUS_INTERVAL, self.log_status, SCHEDULER_JITTER)
+        
         try:
-            last_keepalive = time.time()
+            self.running = True
             
-            while True:
-                current_time = time.time()
-                
-                # Verificar si hay eventos pendientes
-                try:
-                    self.socket.settimeout(0.1)  # Timeout muy corto para no bloquear
-                    data = self.socket.recv(4096).decode('utf-8')
-                    if data and "notify" in data:
-                        self.handle_event(data.strip())
-                except socket.timeout:
-                    pass  # No hay eventos, continuar
-                except Exception:
-                    pass  # Error menor, continuar
+            while self.running:
+                # Si la conexión se perdió no esperar al siguiente keepalive
+                if not self.connected:
+                    self.check_connection()
+                    if not self.running:
+                        break
                 
-                # Verificar conexión cada 60 segundos
-                if current_time - last_keepalive > 60:
-                    if not self.is_connected():
-                        self.logger.warning("⚠️  Conexión perdida, intentando reconectar...")
-                        if not self.reconnect():
-                            self.logger.error("❌ No se pudo reconectar. Deteniendo bot.")
-                            break
-                    
-                    last_keepalive = current_time
-                    
-                    # Mostrar estado cada 5 minutos
-                    if current_time % 300 < 60:
-                        self.logger.info("💚 Bot funcionando correctamente...")
+                # Dormir exactamente hasta el próximo vencimiento, atendiendo eventos
+                timeout = self.scheduler.time_until_next()
+                self.wait_for_events(KEEPALIVE_INTERVAL if timeout is None else timeout)
                 
-                # Pausa corta para no consumir mucho CPU
-                time.sleep(0.5)
+                self.scheduler.run_pending()
                 
         except KeyboardInterrupt:
             self.logger.info("\n🛑 Deteniendo bot por solicitud del usuario...")
         except Exception as e:
             self.logger.error(f"❌ Error inesperado: {e}")
         finally:
+            self.running = False
+            if self.profiler.active:
+                self.profiler.stop()
             self.disconnect()
-            self.logger.info("👋 Bot detenido")
\ No newline at end of file
+            self.logger.info("👋 Bot detenido")
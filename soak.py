@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga prolongada (soak) para el bot de TeamSpeak 3
+
+Levanta en otro proceso un servidor ServerQuery falso que inunda al bot con
+notifytextmessage, notifycliententerview y notifyclientleftview a las tasas
+indicadas, corta la conexión al azar y mide el retraso de los eventos, los
+eventos perdidos o mal parseados, los comandos fallidos, el crecimiento de
+la memoria (RSS) y el tiempo de reconexión. El informe se guarda en JSON
+para compararlo entre versiones.
+
+El servidor corre aparte y las métricas del bot usan contadores y
+histogramas de tamaño fijo, así que la RSS medida es la del bot y no crece
+con la duración de la prueba.
+
+Uso:
+    python soak.py --duration 3600 --text-rate 50 --output informe.json
+    python soak.py --duration 600 --compare informe-anterior.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from simple_bot import SimpleTeamSpeakBot
+
+# Campos extra que el servidor falso añade a cada evento para poder seguirlo
+SEQ_PATTERN = re.compile(r"soakseq=(\d+) soakts=(\d+\.\d{6})$")
+
+
+# Ventana de secuencias recientes en la que se aceptan eventos desordenados
+SEQ_WINDOW = 10000
+
+# Segundos finales sin eventos nuevos para que los últimos lleguen al bot
+DRAIN_SECONDS = 1.0
+
+
+class Histogram:
+    """Histograma logarítmico de tamaño fijo para calcular percentiles
+
+    Cada cubeta cubre un 5% más que la anterior, así que el percentil tiene
+    un error relativo de como máximo un 5% sin guardar cada muestra.
+    """
+
+    def __init__(self, minimum=0.001, maximum=600000.0, growth=1.05):
+        self.minimum = minimum
+        self.log_growth = math.log(growth)
+        self.buckets = [0] * (int(math.log(maximum / minimum) / self.log_growth) + 2)
+        self.count = 0
+        self.max = None
+
+    def add(self, value):
+        if value <= self.minimum:
+            index = 0
+        else:
+            index = min(len(self.buckets) - 1,
+                        int(math.log(value / self.minimum) / self.log_growth) + 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, pct):
+        """Límite superior de la cubeta que contiene el percentil"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                upper = self.minimum * math.exp(self.log_growth * index)
+                return round(min(upper, self.max), 3)
+        return round(self.max, 3)
+
+
+class SequenceTracker:
+    """Cuenta eventos únicos recibidos sin guardar cada secuencia
+
+    Las secuencias del servidor son consecutivas. Solo se recuerdan los
+    huecos dentro de las últimas SEQ_WINDOW secuencias, por si un evento
+    llega desordenado; un hueco más antiguo se da por perdido.
+    """
+
+    def __init__(self, window=SEQ_WINDOW):
+        self.window = window
+        self.next_expected = 0
+        self.gaps = set()
+        self.received = 0
+        self.duplicates = 0
+
+    def add(self, seq):
+        if seq >= self.next_expected:
+            if seq - self.next_expected > self.window:
+                self.gaps.clear()
+                self.gaps.update(range(seq - self.window, seq))
+            else:
+                self.gaps.update(range(self.next_expected, seq))
+            self.next_expected = seq + 1
+            self.received += 1
+            # Olvidar huecos fuera de la ventana
+            if len(self.gaps) > self.window:
+                floor = seq - self.window
+                self.gaps = {gap for gap in self.gaps if gap >= floor}
+        elif seq in self.gaps:
+            self.gaps.discard(seq)
+            self.received += 1
+        else:
+            self.duplicates += 1
+
+
+def read_rss():
+    """Memoria residente actual del proceso en bytes (None si no se puede medir)
+
+    En Linux se lee /proc; en macOS y BSD se pregunta a ps, que da la RSS
+    actual en KiB. ru_maxrss no sirve porque es el máximo, no el valor
+    actual.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/self/status', encoding='utf-8') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+        return None
+
+    try:
+        output = subprocess.run(
+            ['ps', '-o', 'rss=', '-p', str(os.getpid())],
+            capture_output=True, text=True, timeout=5, check=True
+        ).stdout
+        return int(output.strip()) * 1024
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def to_mb(value):
+    """Convertir bytes a MiB (None si no hay medida)"""
+    return round(value / 2**20, 2) if value is not None else None
+
+
+def _run_server(control, options):
+    """Punto de entrada del proceso del servidor falso"""
+    server = FakeServerQuery(**options)
+    server.start()
+    control.send(server.port)
+    # Esperar la orden de parar y devolver las estadísticas
+    control.recv()
+    server.stop()
+    control.send(server.stats())
+
+
+class FakeServerQuery:
+    """Servidor ServerQuery mínimo que genera tormentas de eventos"""
+
+    def __init__(self, text_rate, enter_rate, leave_rate, disconnect_rate, clients, events_for):
+        self.rates = {
+            'notifytextmessage': text_rate,
+            'notifycliententerview': enter_rate,
+            'notifyclientleftview': leave_rate,
+        }
+        self.disconnect_rate = disconnect_rate
+        self.clients = clients
+        self.events_for = events_for
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+
+        self.running = False
+        self.lock = threading.Lock()
+        self.connection = None
+        self.next_seq = 0
+        self.sent_by_type = {name: 0 for name in self.rates}
+        self.commands = 0
+        self.disconnects = 0
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._event_loop, daemon=True).start()
+        if self.disconnect_rate > 0:
+            threading.Thread(target=self._disconnect_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self._drop_connection()
+        self.server.close()
+
+    def stats(self):
+        return {
+            'rates': self.rates,
+            'events_sent': self.next_seq,
+            'sent_by_type': self.sent_by_type,
+            'commands': self.commands,
+            'disconnects': self.disconnects,
+        }
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self._drop_connection()
+            with self.lock:
+                self.connection = conn
+            self._send(conn, "TS3\n\rWelcome to the TeamSpeak 3 ServerQuery interface.\n\r")
+            threading.Thread(target=self._command_loop, args=(conn,), daemon=True).start()
+
+    def _command_loop(self, conn):
+        buffer = b""
+        while self.running:
+            try:
+                data = conn.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for raw_line in lines:
+                line = raw_line.decode('utf-8', errors='replace').strip()
+                if line:
+                    self.commands += 1
+                    self._send(conn, self._reply(line))
+                    if line == "logout":
+                        self._drop_connection(conn)
+                        return
+
+    def _reply(self, line):
+        command = line.split()[0]
+        ok = "error id=0 msg=ok\n\r"
+        if command == "whoami":
+            return "virtualserver_status=online virtualserver_id=1 client_id=1 client_nickname=bot\n\r" + ok
+        if command == "serverinfo":
+            return f"virtualserver_name=Soak\nvirtualserver_clientsonline={self.clients}\n\r" + ok
+        if command == "clientlist":
+            records = "|".join(
+                f"clid={clid} cid=1 client_database_id={clid} client_nickname=Cliente{clid} "
+                f"client_type=0 client_unique_identifier=uid{clid}="
+                for clid in range(2, self.clients + 2)
+            )
+            return records + "\n\r" + ok
+        return ok
+
+    def _event_loop(self):
+        total_rate = sum(self.rates.values())
+        if total_rate <= 0:
+            return
+        names = list(self.rates)
+        weights = [self.rates[name] for name in names]
+
+        # Dejar de emitir un poco antes del final para que todo llegue al bot
+        stop_at = time.monotonic() + self.events_for
+        next_time = time.monotonic()
+        while self.running and time.monotonic() < stop_at:
+            next_time += random.expovariate(total_rate)
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self.lock:
+                conn = self.connection
+            if conn is None:
+                continue
+
+            # La secuencia solo avanza si el evento se envió, así las
+            # secuencias enviadas son consecutivas
+            name = random.choices(names, weights)[0]
+            if self._send(conn, self._event(name, self.next_seq, time.time())):
+                self.next_seq += 1
+                self.sent_by_type[name] += 1
+
+    def _event(self, name, seq, sent_at):
+        tracking = f"soakseq={seq} soakts={sent_at:.6f}"
+        clid = random.randint(2, self.clients + 1)
+        if name == 'notifytextmessage':
+            return (f"notifytextmessage targetmode=2 msg=!soak\\s{seq} target=1 invokerid={clid} "
+                    f"invokername=Cliente{clid} invokeruid=uid{clid}= {tracking}\n\r")
+        if name == 'notifycliententerview':
+            return (f"notifycliententerview cfid=0 ctid=1 reasonid=0 clid={clid} "
+                    f"client_unique_identifier=uid{clid}= client_nickname=Cliente{clid} "
+                    f"client_database_id={clid} client_type=0 {tracking}\n\r")
+        return f"notifyclientleftview cfid=1 ctid=0 reasonid=8 clid={clid} {tracking}\n\r"
+
+    def _disconnect_loop(self):
+        while self.running:
+            time.sleep(random.expovariate(self.disconnect_rate / 60))
+            if self.running and self.connection is not None:
+                self.disconnects += 1
+                self._drop_connection()
+
+    def _send(self, conn, text):
+        try:
+            with self.lock:
+                conn.sendall(text.encode('utf-8'))
+            return True
+        except OSError:
+            return False
+
+    def _drop_connection(self, conn=None):
+        with self.lock:
+            if conn is None or conn is self.connection:
+                conn, self.connection = self.connection, None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+class SoakBot(SimpleTeamSpeakBot):
+    """Bot instrumentado que cuenta eventos y reconexiones con memoria fija"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sequences = SequenceTracker()
+        self.lag_ms = Histogram()
+        self.reconnect_ms = Histogram()
+        self.misparsed = 0
+        self.probes = 0
+        self.probe_failures = 0
+
+    def handle_event(self, event_data):
+        # El servidor está en otro proceso: time.time() es el reloj común
+        received_at = time.time()
+        for line in event_data.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            match = SEQ_PATTERN.search(line)
+            if not line.startswith("notify") or not match:
+                # Evento cortado entre dos lecturas o mezclado con otra respuesta
+                self.misparsed += 1
+                continue
+            self.sequences.add(int(match.group(1)))
+            self.lag_ms.add(max(0.0, received_at - float(match.group(2))) * 1000)
+        super().handle_event(event_data)
+
+    def reconnect(self):
+        started = time.monotonic()
+        result = super().reconnect()
+        if result:
+            self.reconnect_ms.add((time.monotonic() - started - self.reconnect_delay) * 1000)
+        return result
+
+    def probe(self):
+        """Tarea programada - comprobar que los comandos siguen respondiendo"""
+        if not self.connected:
+            return
+        self.probes += 1
+        response = self.send_command("whoami")
+        if not response or "error id=0" not in response or "virtualserver_id=" not in response:
+            self.probe_failures += 1
+
+
+def run_soak(args):
+    """Ejecutar la prueba y devolver el informe"""
+    options = {
+        'text_rate': args.text_rate,
+        'enter_rate': args.enter_rate,
+        'leave_rate': args.leave_rate,
+        'disconnect_rate': args.disconnect_rate,
+        'clients': args.clients,
+        'events_for': max(0.0, args.duration - DRAIN_SECONDS),
+    }
+    control, child_control = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(target=_run_server, args=(child_control, options), daemon=True)
+    server_process.start()
+    port = control.recv()
+
+    bot = SoakBot(host='127.0.0.1', query_port=port, reconnect_delay=args.reconnect_delay)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rss = {'start': read_rss(), 'peak': None, 'end': None}
+    rss['peak'] = rss['start']
+
+    def sample_rss():
+        value = read_rss()
+        if value is not None:
+            rss['peak'] = value if rss['peak'] is None else max(rss['peak'], value)
+
+    def finish():
+        bot.running = False
+
+    bot.scheduler.every("soak-rss", args.sample_interval, sample_rss)
+    bot.scheduler.every("soak-probe", args.probe_interval, bot.probe)
+    bot.scheduler.every("soak-fin", args.duration, finish)
+
+    started = time.monotonic()
+    bot.run()
+    elapsed = time.monotonic() - started
+    rss['end'] = read_rss()
+    sample_rss()
+
+    control.send("stop")
+    server = control.recv()
+    server_process.join(5)
+
+    sent = server['events_sent']
+    dropped = max(0, sent - bot.sequences.received)
+    # Sin medida al principio o al final no se puede calcular el crecimiento
+    rss_growth = None
+    if rss['start'] is not None and rss['end'] is not None:
+        rss_growth = rss['end'] - rss['start']
+
+    return {
+        'label': args.label,
+        'duration_s': round(elapsed, 1),
+        'rates_per_s': server['rates'],
+        'events_sent': sent,
+        'events_sent_by_type': server['sent_by_type'],
+        'events_received': bot.sequences.received,
+        'events_dropped': dropped,
+        'events_dropped_pct': round(100 * dropped / sent, 3) if sent else 0.0,
+        'events_misparsed': bot.misparsed,
+        'events_duplicated': bot.sequences.duplicates,
+        'lag_ms': {
+            'p50': bot.lag_ms.percentile(50),
+            'p90': bot.lag_ms.percentile(90),
+            'p99': bot.lag_ms.percentile(99),
+            'max': bot.lag_ms.max,
+        },
+        'commands_received_by_server': server['commands'],
+        'probe_commands': bot.probes,
+        'probe_failures': bot.probe_failures,
+        'disconnects': server['disconnects'],
+        'reconnects': bot.reconnect_ms.count,
+        'reconnect_ms': {
+            'p50': bot.reconnect_ms.percentile(50),
+            'max': bot.reconnect_ms.max,
+        },
+        'rss_mb': {
+            'start': to_mb(rss['start']),
+            'end': to_mb(rss['end']),
+            'peak': to_mb(rss['peak']),
+            'growth': to_mb(rss_growth),
+            'growth_per_hour': to_mb(rss_growth / (elapsed / 3600)) if rss_growth is not None and elapsed else None,
+        },
+    }
+
+
+def flatten(report, prefix=""):
+    """Aplanar el informe a pares clave/valor numéricos"""
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def print_report(report, previous=None):
+    """Mostrar el informe y, si se da, la diferencia con uno anterior"""
+    current = flatten(report)
+    before = flatten(previous) if previous else {}
+
+    print("=" * 60)
+    print(f"📋 INFORME SOAK - {report['label']}")
+    print("=" * 60)
+    for key, value in current.items():
+        line = f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}"
+        if key in before:
+            line += f"  (antes {before[key]}, diferencia {value - before[key]:+.2f})"
+        print(line)
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga prolongada del bot")
+    parser.add_argument('--duration', type=float, default=300, help="segundos de prueba")
+    parser.add_argument('--text-rate', type=float, default=20, help="notifytextmessage por segundo")
+    parser.add_argument('--enter-rate', type=float, default=5, help="notifycliententerview por segundo")
+    parser.add_argument('--leave-rate', type=float, default=5, help="notifyclientleftview por segundo")
+    parser.add_argument('--disconnect-rate', type=float, default=0.5, help="desconexiones aleatorias por minuto")
+    parser.add_argument('--clients', type=int, default=50, help="clientes simulados en clientlist")
+    parser.add_argument('--reconnect-delay', type=float, default=1, help="espera del bot antes de reconectar")
+    parser.add_argument('--sample-interval', type=float, default=10, help="segundos entre muestras de RSS")
+    parser.add_argument('--probe-interval', type=float, default=5, help="segundos entre comandos de prueba")
+    parser.add_argument('--label', default=os.environ.get('SOAK_LABEL', 'local'), help="nombre de la versión")
+    parser.add_argument('--output', help="guardar el informe en este fichero JSON")
+    parser.add_argument('--compare', help="informe JSON anterior para comparar")
+    args = parser.parse_args()
+
+    report = run_soak(args)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as previous_file:
+            previous = json.load(previous_file)
+
+    print_report(report, previous)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"💾 Informe guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()